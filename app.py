@@ -1,190 +1,646 @@
 from flask import Flask, jsonify, render_template, Response, send_file
-import datetime, threading, time, os, io, csv
+import threading, time, os, io, csv, collections, re, atexit
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
 import cv2, numpy as np
+import torch, yaml
 from ultralytics import YOLO
 import geocoder
-from playsound import playsound
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, fire mask falls back to cv2.inRange
+    njit = None
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _tj = TurboJPEG()
+except (ImportError, RuntimeError, OSError):  # libjpeg-turbo missing, stream falls back to cv2.imencode
+    _tj = None
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pv
+except ImportError:  # CSV export falls back to the csv module
+    pa = None
+try:
+    import simpleaudio as sa
+except ImportError:  # no audio backend, alerts stay silent
+    sa = None
 
 app = Flask(__name__)
 
 # -------------------------
 # Globals
 # -------------------------
-alerts_log = []
+MAX_ALERTS = 10000  # oldest alerts are dropped beyond this
+ALERT_FIELDS = ("id", "time", "msg", "type")
+_alerts = {field: collections.deque(maxlen=MAX_ALERTS) for field in ALERT_FIELDS}
 _next_alert_id = 1
 alerts_lock = threading.Lock()
 camera_running = False
-frame = None
-video_writer = None
+_session_stop = None  # threading.Event of the active camera session
+_session_lock = threading.Lock()
 session_folder = None
 all_sessions = []
+_stream_shm = None  # SharedMemory slot holding the latest encoded frame
+_stream_len = 0
+_stream_seq = 0  # bumped per published frame so viewers wake exactly once per frame
+_frame_cond = threading.Condition()
+JPEG_QUALITY = 80
+MAX_STREAM_VIEWERS = 16  # concurrent /video_feed clients the server is sized for
+STREAM_KEEPALIVE_SECS = 1.5  # idle viewers get a frame at least this often
+STREAM_SLOT_SIZE = 1920 * 1080 * 3  # a raw 1080p BGR frame bounds its JPEG at JPEG_QUALITY
+
+# -------------------------
+# Camera
+# -------------------------
+CAMERA_INDEX = 0
+_HAS_GSTREAMER = re.search(r"GStreamer:\s*YES", cv2.getBuildInformation()) is not None
+_IS_JETSON = os.path.exists("/etc/nv_tegra_release")
+
+
+def _gst_capture_pipeline(index=CAMERA_INDEX):
+    """GStreamer source ending in a BGR appsink that keeps only the newest frame, None if no HW path"""
+    sink = "video/x-raw,format=BGR ! appsink drop=true max-buffers=1"
+    if _IS_JETSON:  # Jetson: hardware MJPEG decode and colour conversion
+        return (f"v4l2src device=/dev/video{index} ! image/jpeg ! nvv4l2decoder mjpeg=1 ! "
+                f"nvvidconv ! video/x-raw,format=BGRx ! videoconvert ! {sink}")
+    if os.name == "nt":
+        return f"mfvideosrc device-index={index} ! videoconvert ! {sink}"
+    return None
+
+
+def _open_camera(index=CAMERA_INDEX):
+    """Open the camera through GStreamer when available, else the platform default backend"""
+    pipeline = _gst_capture_pipeline(index) if _HAS_GSTREAMER else None
+    if pipeline:
+        cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            return cap
+        cap.release()
+    return cv2.VideoCapture(index, cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_ANY)
+
+
+def _gst_writer_pipeline(path):
+    """GStreamer sink encoding H.264 on NVENC into an mp4 file"""
+    location = path.replace(os.sep, "/")
+    if _IS_JETSON:
+        enc = "video/x-raw,format=BGRx ! nvvidconv ! video/x-raw(memory:NVMM),format=NV12 ! nvv4l2h264enc"
+    else:
+        enc = "nvh264enc"
+    return f"appsrc ! videoconvert ! {enc} ! h264parse ! mp4mux ! filesink location={location}"
+
+
+def _open_video_writer(path, fps, size):
+    """Record with the NVENC hardware encoder when available, else software mp4v"""
+    if _HAS_GSTREAMER and (_IS_JETSON or torch.cuda.is_available()):
+        writer = cv2.VideoWriter(_gst_writer_pipeline(path), cv2.CAP_GSTREAMER, 0, fps, size)
+        if writer.isOpened():
+            return writer
+        writer.release()
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
 
 # -------------------------
 # YOLO Model
 # -------------------------
-model = YOLO("yolov8n.pt")
+MODEL_PATH = "yolov8n.pt"
+ENGINE_PATH = "yolov8n.engine"
+CALIB_DIR = "calib"
+CALIB_FRAMES = 300
+BATCH_SIZE = 8
+# Frames waiting for inference; beyond this the oldest is evicted. One batch's worth so
+# batching can still fill up, while latency stays bounded to a single batch of frames.
+MAX_BACKLOG = BATCH_SIZE
+MOTION_SIZE = (80, 45)  # grayscale thumbnail compared between consecutive frames
+MOTION_THRESH = 2.0  # mean absolute difference below which a frame counts as unchanged
+FORCE_INFER_EVERY = 30  # run YOLO at least this often to catch slow changes
+DEVICE = 0 if torch.cuda.is_available() else "cpu"
+# FP16 halves activation bandwidth and runs on tensor cores from Volta (sm_70) onwards
+_use_half = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 7
+
+
+def _collect_calib_frames(n=CALIB_FRAMES):
+    """Grab frames from the webcam for INT8 calibration, return dataset yaml path"""
+    img_dir = os.path.join(CALIB_DIR, "images")
+    os.makedirs(img_dir, exist_ok=True)
+    count = len(os.listdir(img_dir))
+    if count < n:
+        cap = _open_camera()
+        while cap.isOpened() and count < n:
+            ret, f = cap.read()
+            if not ret:
+                break
+            cv2.imwrite(os.path.join(img_dir, f"{count:04d}.jpg"), f)
+            count += 1
+        cap.release()
+    if count == 0:
+        return None
+    data_path = os.path.join(CALIB_DIR, "calib.yaml")
+    with open(data_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump({"path": os.path.abspath(CALIB_DIR), "train": "images", "val": "images",
+                        "names": YOLO(MODEL_PATH).names}, f)
+    return data_path
+
+
+def _ensure_engine():
+    """Build the TensorRT engine once (INT8, FP16 fallback) and return the model path to load"""
+    if os.path.exists(ENGINE_PATH):
+        return ENGINE_PATH
+    if not torch.cuda.is_available():
+        return MODEL_PATH
+    # INT8 tensor cores start at Turing/Xavier (sm_72); older GPUs get an FP16 (or FP32) engine
+    data = _collect_calib_frames() if torch.cuda.get_device_capability() >= (7, 2) else None
+    export_args = {"format": "engine", "batch": BATCH_SIZE, "workspace": 4, "dynamic": True}
+    if data:
+        export_args.update(int8=True, data=data)
+    else:
+        export_args.update(half=_use_half)
+    try:
+        return YOLO(MODEL_PATH).export(**export_args)
+    except Exception as e:
+        print("TensorRT export failed, using PyTorch model:", e)
+        return MODEL_PATH
+
+
+model = YOLO(_ensure_engine(), task="detect")
 ALERT_CLASSES = {"knife", "gun", "pistol", "rifle", "firearm", "fire", "flame", "smoke"}
 CONF_THRESH = 0.35
 
+# Per-class lookup tables so the frame loop never touches class-name strings
+NAMES_LOWER = [str(n).lower() for n in model.names.values()]
+ALERT_LUT = np.zeros(len(NAMES_LOWER), dtype=bool)
+FIRE_LUT = np.zeros(len(NAMES_LOWER), dtype=bool)
+for _i, _name in enumerate(NAMES_LOWER):
+    ALERT_LUT[_i] = _name in ALERT_CLASSES
+    FIRE_LUT[_i] = "fire" in _name or "flame" in _name
+# Device copy so the alert filter runs where the boxes live (no D2H sync on quiet frames)
+ALERT_LUT_T = torch.from_numpy(ALERT_LUT).to(DEVICE)
+
 # -------------------------
 # Helpers
 # -------------------------
+_ts_cache = {}
+
+
+def _now_str(fmt="%Y-%m-%d %H:%M:%S"):
+    """Current local time formatted with fmt, re-formatted at most once per second"""
+    sec = int(time.time())
+    cached = _ts_cache.get(fmt)
+    if cached is None or cached[0] != sec:
+        cached = (sec, time.strftime(fmt, time.localtime(sec)))
+        _ts_cache[fmt] = cached
+    return cached[1]
+
+
 def add_alert(msg, alert_type="info"):
     """Add new alert with timestamp and type"""
     global _next_alert_id
     with alerts_lock:
         alert = {
             "id": _next_alert_id,
-            "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "time": _now_str(),
             "msg": msg,
             "type": alert_type
         }
-        alerts_log.append(alert)
+        for field in ALERT_FIELDS:
+            _alerts[field].append(alert[field])
         _next_alert_id += 1
     print(f"Alert: {alert}")
     return alert
 
 
-def detect_small_fire(frame):
-    """Detect small fire regions using HSV color mask"""
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    lower = np.array([0, 150, 150])
-    upper = np.array([35, 255, 255])
-    mask = cv2.inRange(hsv, lower, upper)
-    mask = cv2.medianBlur(mask, 5)
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    detected = False
-    for cnt in contours:
-        if cv2.contourArea(cnt) > 30:
-            x, y, w, h = cv2.boundingRect(cnt)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 140, 255), 2)
-            detected = True
-    return detected
-
-
-def get_gps_location():
-    """Fetch approximate GPS coordinates from IP"""
+def _alert_rows():
+    """Alert columns as row tuples in ALERT_FIELDS order (caller holds alerts_lock)"""
+    return list(zip(*(_alerts[field] for field in ALERT_FIELDS)))
+
+
+BEEP_PATH = "beep-beep-43875.wav"
+BEEP_INTERVAL = 1.0  # minimum seconds between beeps of the same alert type
+_last_beep_ts = {}
+
+
+def _load_beep():
+    """Decode the beep once so alerts only have to start playback"""
+    if sa is None:
+        print("Beep disabled: simpleaudio is not installed")
+        return None
+    if not os.path.exists(BEEP_PATH):
+        print(f"Beep disabled: {BEEP_PATH} not found (convert beep-beep-43875.mp3 to WAV)")
+        return None
     try:
-        g = geocoder.ip('me')
-        if g.ok:
-            return g.latlng  # [latitude, longitude]
+        return sa.WaveObject.from_wave_file(BEEP_PATH)
     except Exception as e:
-        print("GPS error:", e)
-    return [0.0, 0.0]
+        print("Beep load error:", e)
+        return None
+
+
+_beep = _load_beep()
 
 
-def save_alerts_csv():
+def _play_beep(alert_type):
+    """Play the preloaded beep, rate limited per alert type"""
+    if _beep is None:
+        return
+    now = time.monotonic()
+    if now - _last_beep_ts.get(alert_type, float("-inf")) < BEEP_INTERVAL:
+        return
+    _last_beep_ts[alert_type] = now
+    _beep.play()
+
+
+FIRE_LOWER = np.array([0, 150, 150], dtype=np.uint8)
+FIRE_UPPER = np.array([35, 255, 255], dtype=np.uint8)
+
+
+@dataclass
+class _Buffers:
+    """Reusable per-resolution scratch images for the fire detector"""
+    hsv: np.ndarray
+    mask: np.ndarray
+    blur: np.ndarray
+    labels: np.ndarray
+
+
+_fire_buffers = {}
+
+
+def _get_buffers(h, w):
+    """Return the scratch buffers for an (h, w) frame, allocating on first use"""
+    bufs = _fire_buffers.get((h, w))
+    if bufs is None:
+        bufs = _Buffers(hsv=np.empty((h, w, 3), np.uint8),
+                        mask=np.empty((h, w), np.uint8),
+                        blur=np.empty((h, w), np.uint8),
+                        labels=np.empty((h, w), np.int32))
+        _fire_buffers[(h, w)] = bufs
+    return bufs
+
+
+if njit is not None:
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _fire_kernel(hsv, mask):
+        """Single-pass fire color threshold into mask, returns True if any pixel matched"""
+        h, w = hsv.shape[0], hsv.shape[1]
+        hits = 0
+        for y in prange(h):
+            for x in range(w):
+                if hsv[y, x, 0] <= 35 and hsv[y, x, 1] >= 150 and hsv[y, x, 2] >= 150:
+                    mask[y, x] = 255
+                    hits += 1
+                else:
+                    mask[y, x] = 0
+        return hits > 0
+else:
+    def _fire_kernel(hsv, mask):
+        """Fire color threshold via OpenCV into mask, returns True if any pixel matched"""
+        cv2.inRange(hsv, FIRE_LOWER, FIRE_UPPER, dst=mask)
+        return cv2.countNonZero(mask) > 0
+
+
+def detect_small_fire_ro(frame):
+    """Find small fire regions using HSV color mask, returns [(x, y, w, h), ...] without drawing"""
+    bufs = _get_buffers(frame.shape[0], frame.shape[1])
+    cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=bufs.hsv)
+    if not _fire_kernel(bufs.hsv, bufs.mask):
+        return []
+    cv2.medianBlur(bufs.mask, 5, dst=bufs.blur)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(bufs.blur, labels=bufs.labels)
+    # Label 0 is the background
+    if n < 2 or stats[1:, cv2.CC_STAT_AREA].max() <= 30:
+        return []
+    return [(int(x), int(y), int(w), int(h)) for x, y, w, h, area in stats[1:] if area > 30]
+
+
+def _draw_fire_boxes(frame, fire_boxes):
+    """Outline detected fire regions on the frame"""
+    for x, y, w, h in fire_boxes:
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 140, 255), 2)
+
+
+# Single worker keeps the fire detector's shared scratch buffers race-free
+_fire_pool = ThreadPoolExecutor(max_workers=1)
+_fire_future = None
+
+
+GPS_REFRESH_SECS = 300
+GPS_SPRITE_ORIGIN = (18, 18)  # top-left (x, y) of the GPS overlay in the frame
+_gps_cache = {"latlng": [0.0, 0.0], "sprite": None}
+_gps_lock = threading.Lock()
+_gps_timer = None
+
+
+def _render_gps_sprite(lat, lon):
+    """Pre-render the GPS box and text once, returns (bgr, mask) for blitting"""
+    sprite = np.zeros((76, 266, 3), np.uint8)
+    cv2.rectangle(sprite, (2, 2), (262, 72), (0, 255, 255), 2)
+    cv2.putText(sprite, f"GPS: {lat:.4f},{lon:.4f}", (12, 47),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    return sprite, sprite.any(axis=2)
+
+
+def _refresh_gps():
+    """Fetch approximate GPS coordinates from IP and schedule the next refresh"""
+    global _gps_timer
+    try:
+        g = geocoder.ip('me')
+        if g.ok and g.latlng:
+            sprite = _render_gps_sprite(*g.latlng)
+            with _gps_lock:
+                _gps_cache["latlng"] = g.latlng  # [latitude, longitude]
+                _gps_cache["sprite"] = sprite
+    except Exception as e:
+        print("GPS error:", e)
+    with _gps_lock:
+        _gps_timer = threading.Timer(GPS_REFRESH_SECS, _refresh_gps)
+        _gps_timer.daemon = True
+        _gps_timer.start()
+
+
+def _start_gps_refresh():
+    """Start the background GPS refresh once"""
+    global _gps_timer
+    with _gps_lock:
+        if _gps_timer is not None:
+            return
+        _gps_timer = threading.Timer(0, _refresh_gps)
+        _gps_timer.daemon = True
+        _gps_timer.start()
+
+
+def _overlay_gps(f):
+    """Blit the pre-rendered GPS overlay onto the frame and log the position"""
+    with _gps_lock:
+        lat, lon = _gps_cache["latlng"]
+        sprite = _gps_cache["sprite"]
+    if sprite is None:
+        return
+    bgr, mask = sprite
+    x, y = GPS_SPRITE_ORIGIN
+    roi = f[y:y + bgr.shape[0], x:x + bgr.shape[1]]
+    h, w = roi.shape[:2]
+    np.copyto(roi, bgr[:h, :w], where=mask[:h, :w, None])
+    add_alert(f"GPS Location: {lat:.4f}, {lon:.4f}", "info")
+
+
+def _encode_jpeg(img):
+    """Encode a BGR frame to JPEG bytes"""
+    if _tj is not None:
+        return _tj.encode(img, quality=JPEG_QUALITY, pixel_format=TJPF_BGR)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes()
+
+
+_idle_jpeg_cache = None
+
+
+def _idle_jpeg():
+    """Placeholder JPEG sent to viewers while no camera session is publishing"""
+    global _idle_jpeg_cache
+    if _idle_jpeg_cache is None:
+        img = np.zeros((240, 320, 3), np.uint8)
+        cv2.putText(img, "Camera off", (95, 125), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        _idle_jpeg_cache = _encode_jpeg(img)
+    return _idle_jpeg_cache
+
+
+def _close_stream_slot():
+    """Release the shared frame slot at process exit"""
+    global _stream_shm
+    with _frame_cond:
+        if _stream_shm is not None:
+            _stream_shm.close()
+            _stream_shm.unlink()
+            _stream_shm = None
+
+
+def _publish_frame(jpeg):
+    """Copy an encoded frame into the shared slot and wake every viewer"""
+    global _stream_shm, _stream_len, _stream_seq
+    with _frame_cond:
+        if _stream_shm is None:
+            # One slot for the whole process, shared by every camera session
+            _stream_shm = SharedMemory(create=True, size=STREAM_SLOT_SIZE)
+            atexit.register(_close_stream_slot)
+        if len(jpeg) > _stream_shm.size:
+            print(f"Stream frame dropped: {len(jpeg)} bytes exceeds the {_stream_shm.size} byte slot")
+            return
+        _stream_shm.buf[:len(jpeg)] = jpeg
+        _stream_len = len(jpeg)
+        _stream_seq += 1
+        _frame_cond.notify_all()
+
+
+def _alerts_csv_bytes():
+    """All alerts serialized as CSV, None when there are no alerts"""
+    with alerts_lock:
+        if not _alerts["id"]:
+            return None
+        if pa is not None:
+            table = pa.table({field: list(_alerts[field]) for field in ALERT_FIELDS})
+        else:
+            rows = _alert_rows()
+    if pa is not None:
+        buf = pa.BufferOutputStream()
+        pv.write_csv(table, buf)
+        return buf.getvalue().to_pybytes()
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(ALERT_FIELDS)
+    writer.writerows(rows)
+    return output.getvalue().encode('utf-8')
+
+
+def save_alerts_csv(folder):
     """Save alerts to CSV inside session folder"""
-    global session_folder
-    if not alerts_log:
+    data = _alerts_csv_bytes()
+    if data is None:
         return
-    if not os.path.exists(session_folder):
-        os.makedirs(session_folder)
-    filename = os.path.join(session_folder, f"alerts_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=alerts_log[0].keys())
-        writer.writeheader()
-        writer.writerows(alerts_log)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    filename = os.path.join(folder, f"alerts_{_now_str('%Y%m%d_%H%M%S')}.csv")
+    with open(filename, 'wb') as f:
+        f.write(data)
     print(f"Alerts saved: {filename}")
 
 
 # -------------------------
 # Camera Detection Thread
 # -------------------------
-def camera_detection():
-    global camera_running, frame, video_writer, session_folder, all_sessions
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-    if not cap.isOpened():
-        add_alert("Camera failed to open", "info")
-        camera_running = False
-        return
-
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = 20
-
-    session_folder = os.path.join("sessions", datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
-    os.makedirs(session_folder, exist_ok=True)
-    all_sessions.append(session_folder)
-    video_path = os.path.join(session_folder, "recorded_video.mp4")
-    video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-
-    while camera_running:
+def _capture_frames(cap, buf, buf_cond, stop):
+    """Producer: read camera frames into the ring buffer until the session stops"""
+    while not stop.is_set():
         ret, f = cap.read()
         if not ret:
             add_alert("Frame read failed", "info")
             break
-
-        results = model(f, verbose=False)
-        r = results[0]
-        boxes = getattr(r, "boxes", None)
-
-        # --- Object detection ---
-        if boxes is not None and len(boxes) > 0:
-            names = model.names if hasattr(model, "names") else getattr(r, "names", {})
-            cls_ids = boxes.cls.cpu().numpy().astype(int)
-            confs = boxes.conf.cpu().numpy()
+        with buf_cond:
+            buf.append(f)  # deque(maxlen=MAX_BACKLOG) evicts the stalest frame
+            buf_cond.notify()
+    with buf_cond:
+        stop.set()
+        buf_cond.notify()
+
+
+def _motion_thumb(f):
+    """Small grayscale thumbnail used by the motion gate"""
+    return cv2.resize(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), MOTION_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def _process_frame(f, r, writer, fresh=True):
+    """Alerting, overlays and recording for one frame and its detection result
+
+    fresh=False means r is reused from an earlier frame (static scene): its boxes
+    are drawn again but not re-alerted.
+    """
+    global _fire_future
+    boxes = getattr(r, "boxes", None)
+
+    # --- Object detection ---
+    if fresh and boxes is not None and len(boxes) > 0:
+        cls_t = boxes.cls.long()
+        conf_t = boxes.conf
+        hit = (conf_t >= CONF_THRESH) & ALERT_LUT_T.to(cls_t.device)[cls_t]
+        # Only the single any() bool crosses to the host unless something alertable was found
+        if hit.any().item():
+            cls_ids = cls_t[hit].cpu().numpy()
+            confs = conf_t[hit].cpu().numpy()
             for cls_id, conf in zip(cls_ids, confs):
-                if conf < CONF_THRESH:
-                    continue
-                name = str(names.get(cls_id, cls_id)).lower()
-                if name in ALERT_CLASSES:
-                    alert_type = "fire" if "fire" in name or "flame" in name else "weapon"
-                    add_alert(f"{name} detected (conf {conf:.2f})", alert_type)
-
-                    # 🔊 Play beep sound
-                    threading.Thread(target=lambda: playsound("beep-beep-43875.mp3"), daemon=True).start()
-
-                    # 📍 Get GPS & draw on frame
-                    gps = get_gps_location()
-                    if gps != [0.0, 0.0]:
-                        lat, lon = gps
-                        cv2.rectangle(f, (20, 20), (280, 90), (0, 255, 255), 2)
-                        cv2.putText(f, f"GPS: {lat:.4f},{lon:.4f}", (30, 65),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-                        add_alert(f"GPS Location: {lat:.4f}, {lon:.4f}", "info")
-
-        # --- Small fire color detection ---
-        if detect_small_fire(f):
+                name = NAMES_LOWER[cls_id]
+                alert_type = "fire" if FIRE_LUT[cls_id] else "weapon"
+                add_alert(f"{name} detected (conf {conf:.2f})", alert_type)
+
+                # 🔊 Play beep sound
+                _play_beep(alert_type)
+
+                # 📍 Draw cached GPS on frame
+                _overlay_gps(f)
+
+    # --- Small fire color detection ---
+    # Runs on the worker; a finished result is applied to the current frame (one frame late)
+    if _fire_future is not None and _fire_future.done():
+        fire_boxes = _fire_future.result()
+        _fire_future = None
+        if fire_boxes:
+            _draw_fire_boxes(f, fire_boxes)
             add_alert("Small flame/matchstick detected", "fire")
-            threading.Thread(target=lambda: playsound("beep-beep-43875.mp3"), daemon=True).start()
+            _play_beep("fire")
+            _overlay_gps(f)
+    if _fire_future is None:
+        _fire_future = _fire_pool.submit(detect_small_fire_ro, f.copy())
+
+    try:
+        frame = r.plot(img=f)
+    except Exception:
+        frame = f.copy()
+
+    # Encode once here so every /video_feed viewer just sends the same bytes
+    _publish_frame(_encode_jpeg(frame))
 
-            gps = get_gps_location()
-            if gps != [0.0, 0.0]:
-                lat, lon = gps
-                cv2.rectangle(f, (20, 20), (280, 90), (0, 255, 255), 2)
-                cv2.putText(f, f"GPS: {lat:.4f},{lon:.4f}", (30, 65),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-                add_alert(f"GPS Location: {lat:.4f}, {lon:.4f}", "info")
+    if writer:
+        writer.write(frame)
 
-        try:
-            frame = r.plot()
-        except Exception:
-            frame = f.copy()
 
-        if video_writer:
-            video_writer.write(frame)
-        time.sleep(0.01)
+def _end_session(stop):
+    """Mark the camera stopped, unless a newer session has already replaced this one"""
+    global camera_running
+    with _session_lock:
+        if _session_stop is stop:
+            camera_running = False
 
-    cap.release()
-    if video_writer:
-        video_writer.release()
-    camera_running = False
-    save_alerts_csv()
+
+def camera_detection(stop):
+    global session_folder, all_sessions, _fire_future
+    cap = _open_camera()
+    if not cap.isOpened():
+        add_alert("Camera failed to open", "info")
+        _end_session(stop)
+        return
+
+    _start_gps_refresh()
+    _fire_future = None
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = 20
+
+    folder = os.path.join("sessions", _now_str("%Y%m%d_%H%M%S"))
+    os.makedirs(folder, exist_ok=True)
+    session_folder = folder
+    all_sessions.append(folder)
+    video_path = os.path.join(folder, "recorded_video.mp4")
+    writer = _open_video_writer(video_path, fps, (width, height))
+
+    # Producer fills a ring buffer of frames; consumer runs one batched inference per drain
+    buf = collections.deque(maxlen=MAX_BACKLOG)
+    buf_cond = threading.Condition()
+    producer = threading.Thread(target=_capture_frames, args=(cap, buf, buf_cond, stop), daemon=True)
+    producer.start()
+
+    try:
+        _run_detection(buf, buf_cond, stop, writer)
+    finally:
+        # Always stop the producer and finalise outputs, even if inference raised
+        stop.set()
+        producer.join()
+        cap.release()
+        if writer:
+            writer.release()
+        _end_session(stop)
+        save_alerts_csv(folder)
+
+
+def _run_detection(buf, buf_cond, stop, writer):
+    """Consumer: batched, motion-gated inference over the ring buffer until the session stops"""
+    prev_thumb, since_infer, last_r = None, 0, None
+    while True:
+        with buf_cond:
+            while not stop.is_set() and not buf:
+                buf_cond.wait(0.5)
+            if stop.is_set():
+                break
+            batch = [buf.popleft() for _ in range(min(len(buf), BATCH_SIZE))]
+
+        # Motion gate: unchanged frames skip YOLO and reuse the last result
+        infer = []
+        for f in batch:
+            thumb = _motion_thumb(f)
+            since_infer += 1
+            moved = prev_thumb is None or cv2.absdiff(thumb, prev_thumb).mean() >= MOTION_THRESH
+            prev_thumb = thumb
+            infer.append(moved or since_infer >= FORCE_INFER_EVERY)
+            if infer[-1]:
+                since_infer = 0
+
+        # Deque is FIFO, so results come back in capture order
+        inputs = [f for f, flag in zip(batch, infer) if flag]
+        results = iter(())
+        if inputs:
+            results = iter(model(inputs, imgsz=640, verbose=False, half=_use_half, device=DEVICE))
+        for f, flag in zip(batch, infer):
+            if flag:
+                last_r = next(results)
+            _process_frame(f, last_r, writer, fresh=flag)
 
 
 
 # Video Streaming
 
 def generate_frames():
-    global frame
+    # Start from the current frame number so a new viewer never gets a stale frame from an ended session
+    with _frame_cond:
+        seq = _stream_seq
+    frame_bytes = None
     while True:
-        if frame is None:
-            continue
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
+        with _frame_cond:
+            if _frame_cond.wait_for(lambda: _stream_seq != seq, timeout=STREAM_KEEPALIVE_SECS):
+                seq = _stream_seq
+                if _stream_shm is not None:
+                    frame_bytes = bytes(_stream_shm.buf[:_stream_len])
+            elif not camera_running:
+                frame_bytes = None
+        # Always write something, even while idle: the stream stays open across camera
+        # restarts, and a disconnected viewer fails here and frees its worker thread
         yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+               b'Content-Type: image/jpeg\r\n\r\n' + (frame_bytes or _idle_jpeg()) + b'\r\n')
 
 
 
@@ -203,42 +659,41 @@ def video_feed():
 @app.route('/alerts', methods=['GET'])
 def get_alerts():
     with alerts_lock:
-        return jsonify(alerts_log)
+        return jsonify([dict(zip(ALERT_FIELDS, row)) for row in _alert_rows()])
 
 
 @app.route('/start_camera', methods=['GET'])
 def start_camera():
-    global camera_running
-    if camera_running:
-        return "Camera already running"
-    camera_running = True
-    threading.Thread(target=camera_detection, daemon=True).start()
+    global camera_running, _session_stop
+    with _session_lock:
+        if camera_running:
+            return "Camera already running"
+        camera_running = True
+        _session_stop = threading.Event()
+        threading.Thread(target=camera_detection, args=(_session_stop,), daemon=True).start()
     return "Camera started"
 
 
 @app.route('/stop_camera', methods=['GET'])
 def stop_camera():
     global camera_running
-    if not camera_running:
-        return "Camera not running"
-    camera_running = False
+    with _session_lock:
+        if not camera_running:
+            return "Camera not running"
+        camera_running = False
+        _session_stop.set()
     return "Camera stopping"
 
 
 @app.route('/download_alerts', methods=['GET'])
 def download_alerts():
-    with alerts_lock:
-        if not alerts_log:
-            return "No alerts to download", 404
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=alerts_log[0].keys())
-        writer.writeheader()
-        writer.writerows(alerts_log)
-        output.seek(0)
-        return send_file(io.BytesIO(output.getvalue().encode('utf-8')),
-                         mimetype='text/csv',
-                         download_name=f'alerts_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                         as_attachment=True)
+    data = _alerts_csv_bytes()
+    if data is None:
+        return "No alerts to download", 404
+    return send_file(io.BytesIO(data),
+                     mimetype='text/csv',
+                     download_name=f'alerts_{_now_str("%Y%m%d_%H%M%S")}.csv',
+                     as_attachment=True)
 
 
 @app.route('/download_video', methods=['GET'])
@@ -251,7 +706,7 @@ def download_video():
         return "Video not found", 404
     return send_file(video_path,
                      mimetype='video/mp4',
-                     download_name=f'detection_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.mp4',
+                     download_name=f'detection_{_now_str("%Y%m%d_%H%M%S")}.mp4',
                      as_attachment=True)
 
 
@@ -259,4 +714,11 @@ def download_video():
 if __name__ == "__main__":
     add_alert("Smart Surveillance started", "info")
     os.makedirs("sessions", exist_ok=True)
-    app.run(debug=True, port=5000)
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(port=5000, threaded=True)
+    else:
+        # Each /video_feed viewer holds a worker thread for the life of its stream, so size
+        # the pool for the expected viewers plus headroom for /alerts and the control routes
+        serve(app, host="127.0.0.1", port=5000, threads=MAX_STREAM_VIEWERS + 8)